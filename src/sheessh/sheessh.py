@@ -1,12 +1,32 @@
 import os
-import sys
+import atexit
+import queue
 import json
-from pathlib import Path, PureWindowsPath
+import logging
+import asyncio
+import functools
+import shlex
+import shutil
+import stat
+import subprocess
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path, PurePosixPath, PureWindowsPath
 from datetime import datetime
+from collections import OrderedDict, namedtuple
 
 from fabric import Connection
 from invoke.exceptions import UnexpectedExit, AuthFailure
-from paramiko.ssh_exception import BadAuthenticationType
+from invoke.runners import Result
+from paramiko.sftp_attr import SFTPAttributes
+from paramiko.ssh_exception import BadAuthenticationType, ChannelException
+
+try:
+    import asyncssh
+except ImportError:  # optional dependency, required only by AsyncHost
+    asyncssh = None
 
 """
 This module provides functions for manipulating remote file systems via ssh and SFTP
@@ -15,10 +35,339 @@ in order to be able efficiently capture data for R&D in application tests.
 Author: David Rejchrt (david.rejchrt@leica-geosystems.com) 
 """
 
+logger = logging.getLogger(__name__)
+
+# Connections shared by all Host instances with the same connection parameters:
+# (host, port, user, identity, password) -> fabric Connection
+_CONN_POOL: dict[tuple, Connection] = {}
+_CONN_POOL_LOCK = threading.Lock()
+# Number of Host instances using each pooled connection (opened and not closed yet)
+_CONN_USERS: dict[tuple, int] = {}
+
+# Exit codes used by the compound shell commands to report failed checks
+_EXIT_NOT_FOUND = 10
+_EXIT_EXISTS = 11
+_EXIT_IS_DIR = 12
+
+# Maximum number of paths in each of the metadata caches of a host
+_STAT_CACHE_SIZE = 1024
+# Maximum number of seconds for which a path is remembered as not existing
+_NEGATIVE_CACHE_TTL = 2
+
+# Metadata of a remote path, as returned by _stat. size and mtime are None if the path does not exist.
+# is_file is True only for regular files (like test -f), not for sockets, devices etc.
+_RemoteStat = namedtuple("_RemoteStat", ["exists", "is_dir", "is_file", "size", "mtime"])
+_MISSING = _RemoteStat(False, False, False, None, None)
+
+# Size of the blocks in which downloaded files are written to the local disk
+_COPY_BUFFER_SIZE = 1 << 20
+# Files larger than this are downloaded in _RANGE_PARTS parallel ranges, each over its own SFTP session
+_RANGE_THRESHOLD = 64 << 20
+_RANGE_PARTS = 4
+
+# How long the master connection of the ssh client used by rsync stays open after the last use
+_SSH_CONTROL_PERSIST = "10m"
+
+# Multithreaded compressors used for archives, in order of preference: name -> (command, archive extension)
+_COMPRESSORS = {
+    "zstd": ("zstd -T0 -3", ".tar.zst"),
+    "pigz": ("pigz", ".tar.gz"),
+}
+
+
+def _shq(path) -> str:
+    """
+    Quotes a path, so it can be safely used as a single argument in a remote shell command.
+    Accepts also path-like objects. Commands taking options have to be given -- before the quoted
+    paths, otherwise a path starting with - would be taken for an option.
+    :param path: path to be quoted
+    :return: quoted path
+    """
+    return shlex.quote(str(path))
+
+
+def _raise_for_exit(result, not_found: str, exists: str = None, is_dir: str = None):
+    """
+    Translates the exit code of a compound shell command into an exception.
+    :param result: result of the host.run call, run with warn=True
+    :param not_found: message of the FileNotFoundError raised on _EXIT_NOT_FOUND
+    :param exists: message of the FileExistsError raised on _EXIT_EXISTS
+    :param is_dir: message of the IsADirectoryError raised on _EXIT_IS_DIR
+    :return:
+    """
+    if result.exited == _EXIT_NOT_FOUND:
+        raise FileNotFoundError(not_found)
+    if result.exited == _EXIT_EXISTS:
+        raise FileExistsError(exists)
+    if result.exited == _EXIT_IS_DIR:
+        raise IsADirectoryError(is_dir)
+    if result.failed:
+        raise UnexpectedExit(result)
+
+
+def _channel_result(chan, cmd: str) -> Result:
+    """
+    Waits for a command started by Host.exec_channel to finish and returns its result,
+    so it can be checked the same way as the result of host.run, e.g. by _raise_for_exit.
+    The stdout of the command is not captured, it is expected to be consumed by the caller.
+    :param chan: paramiko Channel with executed command
+    :param cmd: the executed command
+    :return: invoke Result
+    """
+    exited = chan.recv_exit_status()
+    stderr = chan.makefile_stderr("rb").read().decode(errors="replace")
+    return Result(stderr=stderr, command=cmd, exited=exited)
+
+
+def _channel_copy(chan, f):
+    """
+    Writes stdout of a command started by Host.exec_channel to a binary file object as it arrives.
+    Receives from the channel directly, without the buffered file of channel.makefile,
+    which would copy every block once more.
+    :param chan: paramiko Channel with executed command
+    :param f: file object opened for writing in binary mode
+    :return:
+    """
+    while True:
+        data = chan.recv(_COPY_BUFFER_SIZE)
+        if not data:
+            break
+        f.write(data)
+
+
+def _local_dest(rem_file, dest=None) -> Path:
+    """
+    Resolves the local path of a downloaded remote file. If dest is not provided, the file goes
+    to user's download directory. If dest is an existing directory, or it ends with / or \\
+    denoting a directory, the original file name is kept. Otherwise, dest is the path of the file.
+    :param rem_file: path to the remote file
+    :param dest: local destination provided by the user
+    :return: local path of the file
+    """
+    fname = Path(rem_file).name
+    if dest is None:
+        return Path.home() / "Downloads" / fname
+    if os.path.isdir(dest) or str(dest)[-1] in ("/", "\\"):
+        return Path(dest, fname)
+    return Path(dest)
+
+
+def _sftp_get(sftp, remote_file, local_file, attr=None):
+    """
+    Downloads a remote file over SFTP. The read requests for the whole file are sent ahead
+    (paramiko prefetch), so the transfer is not throttled by waiting for each block's round trip.
+    Like fabric's get, the permission bits of the remote file are copied to the local file.
+    The local file also gets the modification time of the remote file, see _copy_attributes.
+    :param sftp: paramiko SFTPClient
+    :param remote_file: path to the remote file
+    :param local_file: path to the local file
+    :param attr: SFTPAttributes of the remote file if already known, saves one stat request
+    :return:
+    """
+    if attr is None:
+        attr = sftp.stat(remote_file)
+    with sftp.open(remote_file, "rb") as rf, open(local_file, "wb") as lf:
+        rf.prefetch(attr.st_size)
+        shutil.copyfileobj(rf, lf, _COPY_BUFFER_SIZE)
+    _copy_attributes(local_file, attr)
+
+
+def _copy_attributes(local_file, attr):
+    """
+    Copies permission bits and modification time of a remote file to its downloaded copy.
+    Thanks to the modification time, an unchanged file can be recognized (see _local_unchanged)
+    without downloading it again.
+    :param local_file: path to the local file
+    :param attr: SFTPAttributes of the remote file
+    :return:
+    """
+    os.chmod(local_file, stat.S_IMODE(attr.st_mode))
+    os.utime(local_file, (attr.st_mtime, attr.st_mtime))
+
+
+def _download(host, remote_file, local_file, attr):
+    """
+    Downloads a remote file over the SFTP client of the host, large files in parallel ranges.
+    :param host: target Host
+    :param remote_file: path to the remote file
+    :param local_file: path to the local file, its directory has to exist
+    :param attr: SFTPAttributes of the remote file
+    :return:
+    """
+    if attr.st_size > _RANGE_THRESHOLD:
+        _sftp_get_ranges(host.conn, remote_file, local_file, attr)
+    else:
+        _sftp_get(host.sftp, remote_file, local_file, attr)
+
+
+def _local_unchanged(local_file, attr) -> bool:
+    """
+    Checks whether a local copy of a remote file is up-to-date, i.e. it has the same size
+    and modification time as the remote file. The times may differ by less than 2 seconds,
+    which is the resolution of FAT file systems (e.g. USB drives).
+    :param local_file: path to the local file
+    :param attr: SFTPAttributes of the remote file
+    :return: bool
+    """
+    try:
+        st = os.stat(local_file)
+    except FileNotFoundError:
+        return False
+    return st.st_size == attr.st_size and abs(st.st_mtime - attr.st_mtime) < 2
+
+
+def _sftp_get_ranges(conn, remote_file, local_file, attr, parts: int = _RANGE_PARTS):
+    """
+    Downloads a large remote file in parallel ranges. Every range is read by its own SFTP session
+    (SSH channel) on the same connection with pipelined readv requests, so the transfer is not
+    limited by the flow control window of a single channel on links with high latency.
+    Like _sftp_get, the permission bits and modification time of the remote file are copied to the local file.
+    :param conn: opened fabric Connection
+    :param remote_file: path to the remote file
+    :param local_file: path to the local file
+    :param attr: SFTPAttributes of the remote file
+    :param parts: number of parallel ranges
+    :return:
+    """
+    size = attr.st_size
+    part_size = -(-size // parts)
+    with open(local_file, "wb") as lf:
+        lf.truncate(size)
+
+    def fetch(start):
+        end = min(start + part_size, size)
+        blocks = [(offset, min(_COPY_BUFFER_SIZE, end - offset))
+                  for offset in range(start, end, _COPY_BUFFER_SIZE)]
+        sftp = conn.client.open_sftp()
+        try:
+            with sftp.open(remote_file, "rb") as rf, open(local_file, "r+b") as lf:
+                lf.seek(start)
+                for data in rf.readv(blocks):
+                    lf.write(data)
+        finally:
+            sftp.close()
+
+    with ThreadPoolExecutor(max_workers=parts) as executor:
+        for future in [executor.submit(fetch, start) for start in range(0, size, part_size)]:
+            future.result()
+    _copy_attributes(local_file, attr)
+
+
+def _walk_sftp(sftp, root):
+    """
+    Walks remote directory tree over SFTP, one request per directory. Yields (path, attributes)
+    of all directories and regular files under root (including root). A directory is always yielded
+    before its content. Files of each directory are yielded largest first, so the big transfers
+    start early and the small ones fill the gaps. Symbolic links are not followed.
+    :param sftp: paramiko SFTPClient
+    :param root: path to remote directory
+    :return: generator of (path, paramiko SFTPAttributes) tuples
+    """
+    root = root.rstrip("/") or "/"
+    yield root, sftp.stat(root)
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        for attr in sorted(sftp.listdir_attr(directory), key=lambda a: a.st_size or 0, reverse=True):
+            path = f"{directory.rstrip('/')}/{attr.filename}"
+            if stat.S_ISDIR(attr.st_mode):
+                yield path, attr
+                stack.append(path)
+            elif stat.S_ISREG(attr.st_mode):
+                yield path, attr
+
+
+def _walk_find(host, root):
+    """
+    Walks remote directory tree with a single find command, whose output is parsed while it is
+    streamed. Yields the same (path, attributes) as _walk_sftp, without one round trip per directory,
+    but the files are yielded in the order of find. Requires GNU find (-printf), falls back
+    to _walk_sftp if it is not available.
+    :param host: target Host
+    :param root: path to remote directory
+    :return: generator of (path, paramiko SFTPAttributes) tuples
+    """
+    root = root.rstrip("/") or "/"
+    # Records are separated by NUL, which is the only character that can't appear in a path
+    cmd = f"find -H {_shq(root)} \\( -type d -o -type f \\) -printf '%y %m %s %T@ %p\\0'"
+    chan = host.exec_channel(cmd)
+    yielded = False
+    try:
+        buf = b""
+        while True:
+            data = chan.recv(_COPY_BUFFER_SIZE)
+            if not data:
+                break
+            *records, buf = (buf + data).split(b"\0")
+            for record in records:
+                kind, mode, size, mtime, path = record.decode().split(" ", 4)
+                attr = SFTPAttributes()
+                attr.st_mode = int(mode, 8) | (stat.S_IFDIR if kind == "d" else stat.S_IFREG)
+                attr.st_size = int(size)
+                attr.st_mtime = attr.st_atime = int(float(mtime))
+                yielded = True
+                yield path, attr
+        result = _channel_result(chan, cmd)
+    finally:
+        chan.close()
+
+    if result.failed:
+        if yielded:
+            # e.g. unreadable subdirectory
+            raise UnexpectedExit(result)
+        yield from _walk_sftp(host.sftp, root)
+
+
+@atexit.register
+def close_all_connections():
+    """
+    Closes all connections opened by Host instances. Called automatically on interpreter exit.
+    Hosts stay usable, their connections are reopened on next operation.
+    :return:
+    """
+    with _CONN_POOL_LOCK:
+        for conn in _CONN_POOL.values():
+            conn.close()
+
+
+def _ttl_cache(ttl_seconds: float, key=None):
+    """
+    Decorator memoizing truthy results of a function for ttl_seconds.
+    Falsy results (e.g. failed checks) are never cached, so they are retried on next call.
+    :param ttl_seconds: how long a result stays valid
+    :param key: function computing the cache key from the call arguments. By default,
+        the arguments themselves are used as the key, so they have to be hashable.
+    :return: decorator
+    """
+    def decorator(func):
+        cache = {}
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            k = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+            hit = cache.get(k)
+            if hit is not None and hit[0] >= time.monotonic():
+                return hit[1]
+            value = func(*args, **kwargs)
+            if value:
+                cache[k] = (time.monotonic() + ttl_seconds, value)
+            return value
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
+
 
 class Host:
     """
     This class collects the connection parameters like hostname, ip address, authentication etc.
+    It holds a single SSH connection which is reused by all the functions operating on the host,
+    and shared with all other Host instances with the same connection parameters.
+    Can be used as a context manager, closing the connection on exit:
+
+        with Host(hostname="TS20-4790086", identity=ID) as host:
+            touch_remote(host, "/mnt/data/test.txt")
     """
 
     def __init__(self,
@@ -27,7 +376,9 @@ class Host:
                  port: int = 22,
                  user: str = "root",
                  password: str = "",
-                 identity: str = None
+                 identity: str = None,
+                 stat_cache_ttl: float = 5,
+                 keepalive: int = 15
                  ):
         """
         Constructor for Host. Either hostname (e.g. TS20-4790086) or IP address must be provided.
@@ -42,6 +393,10 @@ class Host:
         :param user: username. Default is "root"
         :param password: password. Default is empty string.
         :param identity: path to identity file, if
+        :param stat_cache_ttl: number of seconds for which the remote path metadata
+            (existence, type, size...) is cached. 0 disables the cache.
+        :param keepalive: interval in seconds of SSH keepalive messages, which prevent firewalls
+            from dropping the idle connection. 0 disables keepalive.
         """
         self.hostname = hostname
         self.ip = ip
@@ -49,11 +404,41 @@ class Host:
         self.user = user
         self.password = password
         self.identity = identity
+        self.stat_cache_ttl = stat_cache_ttl
+        self.keepalive = keepalive
+
+        # path -> (expiry timestamp, _RemoteStat of the path), least recently used first
+        self._stat_cache: OrderedDict[str, tuple[float, _RemoteStat]] = OrderedDict()
+        # directory path -> (mtime of the directory, size of the directory tree in bytes)
+        self._dir_size_cache: OrderedDict[str, tuple[int, int]] = OrderedDict()
+        # compressor available on the host, "" if there is none, None if not checked yet
+        self._compressor: str = None
+        # whether rsync is available on the host, None if not checked yet
+        self._has_rsync: bool = None
+        # persistent remote shell used by run_fast, opened on first use
+        self._shell_chan = None
+        self._shell_lock = threading.Lock()
 
         # If neither are provided, connection impossible
         if hostname is None and ip is None:
             raise ValueError("Neither hostname nor ip address provided")
 
+        # Hosts with the same connection parameters share one connection
+        key = (self.ip if self.ip else self.hostname, self.port, self.user, self.identity, self.password)
+        with _CONN_POOL_LOCK:
+            if key not in _CONN_POOL:
+                _CONN_POOL[key] = self.new_connection()
+            self.conn = _CONN_POOL[key]
+        self._pool_key = key
+        # whether this Host is counted in _CONN_USERS
+        self._conn_user = False
+
+    def new_connection(self) -> Connection:
+        """
+        Creates a new (not yet opened) connection to the host using the connection parameters
+        of this Host. Used for operations that need a connection independent of the shared one.
+        :return: fabric Connection
+        """
         ckw = {  # ckw = Connection Key Words
             "password": self.password
         }
@@ -61,13 +446,117 @@ class Host:
             ckw["key_filename"] = self.identity
 
         # Connection from the "fabric" package.
-        self.conn = Connection(
+        return Connection(
             host=self.ip if self.ip else self.hostname,
             port=self.port,
             user=self.user,
             connect_kwargs=ckw
         )
 
+    @staticmethod
+    def _cache_key(path) -> str:
+        return os.fspath(path).rstrip("/") or "/"
+
+    def _cache_get(self, path):
+        """
+        Returns cached metadata (_RemoteStat) of remote path, or None if it is not cached or has expired.
+        """
+        key = self._cache_key(path)
+        entry = self._stat_cache.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        self._stat_cache.move_to_end(key)
+        return entry[1]
+
+    def _cache_set(self, path, record):
+        """
+        Caches metadata (_RemoteStat) of remote path for stat_cache_ttl seconds.
+        Paths which don't exist are remembered for at most _NEGATIVE_CACHE_TTL seconds.
+        """
+        if self.stat_cache_ttl <= 0:
+            return
+        ttl = self.stat_cache_ttl if record.exists else min(self.stat_cache_ttl, _NEGATIVE_CACHE_TTL)
+        key = self._cache_key(path)
+        self._stat_cache[key] = (time.monotonic() + ttl, record)
+        self._stat_cache.move_to_end(key)
+        if len(self._stat_cache) > _STAT_CACHE_SIZE:
+            self._stat_cache.popitem(last=False)
+
+    def _cache_invalidate(self, *paths):
+        """
+        Drops cached metadata of given remote paths, everything below them (a removed or moved
+        directory takes its content with it) and all directories containing them (they may have
+        been created by mkdir -p, and their modification time or size changed).
+        Has to be called by every function modifying the remote file system.
+        """
+        for path in paths:
+            key = self._cache_key(path)
+            # The caches are bounded, so a scan is cheap enough
+            prefix = key.rstrip("/") + "/"
+            for cache in (self._stat_cache, self._dir_size_cache):
+                for cached in [k for k in cache if k.startswith(prefix)]:
+                    del cache[cached]
+            while True:
+                self._stat_cache.pop(key, None)
+                self._dir_size_cache.pop(key, None)
+                parent = self._cache_key(os.path.dirname(key))
+                if parent == key:
+                    break
+                key = parent
+
+    def clear_stat_cache(self):
+        """
+        Drops all cached metadata of remote paths.
+        :return:
+        """
+        self._stat_cache.clear()
+        self._dir_size_cache.clear()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self):
+        """
+        Opens the SSH connection to the host, if it is not open yet.
+        The connection is kept open and shared by all subsequent operations on this host,
+        so the SSH handshake and authentication is done only once.
+        :return:
+        """
+        with _CONN_POOL_LOCK:
+            if not self._conn_user:
+                _CONN_USERS[self._pool_key] = _CONN_USERS.get(self._pool_key, 0) + 1
+                self._conn_user = True
+        if not self.conn.is_connected:
+            # fabric keeps its SFTP client even if the connection dropped, it would stay bound
+            # to the dead transport
+            self.conn._sftp = None
+            self.conn.open()
+            if self.keepalive:
+                self.conn.client.get_transport().set_keepalive(self.keepalive)
+
+    def close(self):
+        """
+        Closes the SSH connection to the host. Next operation on the host will reopen it.
+        The connection is shared by all Host instances with the same connection parameters,
+        it is closed only when the last of them, which have used it, closes it.
+        :return:
+        """
+        with self._shell_lock:
+            if self._shell_chan is not None:
+                self._shell_chan.close()
+                self._shell_chan = None
+        with _CONN_POOL_LOCK:
+            if not self._conn_user:
+                return
+            self._conn_user = False
+            _CONN_USERS[self._pool_key] -= 1
+            if _CONN_USERS[self._pool_key] == 0:
+                self.conn.close()
+
     def run(self, cmd: str, **kwargs):
         """
         This function executes a command on the remote machine and captures the outputs
@@ -79,22 +568,115 @@ class Host:
         :param kwargs:
         :return:
         """
+        self.open()
+        kwargs.setdefault("pty", False)
         return self.conn.run(command=cmd, **kwargs)
 
+    def _shell(self):
+        """
+        Returns the persistent shell of the host, opens it if it is not open yet
+        (or it was closed together with the connection).
+        :return: paramiko Channel running sh reading commands from its stdin
+        """
+        if self._shell_chan is None or self._shell_chan.closed:
+            self._shell_chan = self.exec_channel("sh -s")
+            self._shell_chan.set_combine_stderr(True)
+        return self._shell_chan
+
+    def run_fast(self, cmd: str, hide: bool = True, warn: bool = False) -> Result:
+        """
+        Executes a command in a persistent shell on the remote machine. Unlike run, it doesn't open
+        a new SSH channel (and a new session on the server) for every command, which makes it much faster
+        for short commands like tests, mkdir, touch etc. The command runs in a child
+        shell with stdin from /dev/null, stderr is merged into stdout.
+
+        Commands which are not hidden are executed by run, so their output is streamed as usual.
+
+        :param cmd: command to be run on the remote machine
+        :param hide: controls whether the output will be printed to stdout
+        :param warn: if False, UnexpectedExit is raised when the command fails
+        :return: invoke Result
+        """
+        if not hide:
+            return self.run(cmd, hide=hide, warn=warn)
+
+        marker = f"__SHEESSH_END_{os.urandom(8).hex()}__"
+        end = f"\n{marker} ".encode()
+        buf = bytearray()
+        with self._shell_lock:
+            chan = self._shell()
+            try:
+                # The command is parsed by a child shell, so a syntax error (e.g. unbalanced quote)
+                # fails only the child, and the persistent shell doesn't wait for the rest of it
+                chan.sendall(f"sh -c {shlex.quote(cmd)} </dev/null 2>&1; printf '\\n{marker} %d\\n' $?\n".encode())
+                while True:
+                    idx = buf.find(end)
+                    if idx != -1 and buf.find(b"\n", idx + len(end)) != -1:
+                        break
+                    data = chan.recv(32768)
+                    if not data:
+                        raise EOFError(f"Remote shell on {self.hostname or self.ip} exited unexpectedly")
+                    buf += data
+            except BaseException:
+                # The shell is out of sync (or dead), next command gets a new one
+                chan.close()
+                self._shell_chan = None
+                raise
+
+        stdout = buf[:idx].decode(errors="replace")
+        exited = int(buf[idx + len(end):buf.find(b"\n", idx + len(end))])
+        result = Result(stdout=stdout, command=cmd, exited=exited, hide=("stdout", "stderr"))
+        if result.failed and not warn:
+            raise UnexpectedExit(result)
+        return result
+
+    @property
+    def sftp(self):
+        """
+        SFTP client of the host connection. It is opened on first use and reused afterwards.
+        Not safe to be shared between threads.
+        :return: paramiko SFTPClient
+        """
+        self.open()
+        if self.conn._sftp is not None and self.conn._sftp.get_channel().closed:
+            self.conn._sftp = None
+        return self.conn.sftp()
+
+    def exec_channel(self, cmd: str):
+        """
+        Executes a command on the remote machine and returns the paramiko channel it runs in,
+        without waiting for the command to finish. Allows consuming the command output as a stream
+        via channel.makefile("rb"). The caller is responsible for closing the channel.
+
+        :param cmd: command to be run on the remote machine
+        :return: paramiko Channel
+        """
+        self.open()
+        chan = self.conn.client.get_transport().open_session()
+        chan.exec_command(cmd)
+        return chan
+
     def download(self, file, dest=None):
         """
         Download a remote file to specified destination on local system.
         Regarding creating directories etc; the behaviour is consistent with the behaviour
-        of scp or sftp commands.
-
-        Wrapper for the fabric transfer get method.
+        of the fabric transfer get method.
         https://docs.fabfile.org/en/latest/api/transfer.html#fabric.transfer.Transfer.get
 
+        The whole file is requested ahead (pipelined SFTP reads) and written in 1 MiB blocks.
+        Files larger than 64 MiB are downloaded in several parallel ranges.
+
         :param file: path to a file on the remote system
         :param dest: local path
         :return:
         """
-        self.conn.get(file, local=dest)
+        fname = os.path.basename(file)
+        if dest is None:
+            dest = fname
+        elif os.path.isdir(dest) or str(dest)[-1] in ("/", "\\"):
+            dest = os.path.join(dest, fname)
+        os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+        _download(self, file, dest, self.sftp.stat(file))
 
     def upload(self, file, dest):
         """
@@ -110,42 +692,122 @@ class Host:
         :return:
         """
 
+        self.open()
         self.conn.put(file, remote=dest)
 
 
+class AsyncHost:
+    """
+    Asynchronous counterpart of Host, built on top of the optional asyncssh package
+    (pip install sheessh[async]). Takes the connection parameters from a Host.
+    Many SFTP requests can be in flight over its single connection at the same time,
+    without being limited by the number of sessions allowed by the remote sshd.
+
+        async with AsyncHost(host) as ahost:
+            sftp = await ahost.sftp()
+    """
+
+    def __init__(self, host: Host):
+        """
+        Constructor for AsyncHost. Raises ImportError if asyncssh is not installed.
+        :param host: host providing the connection parameters
+        """
+        if asyncssh is None:
+            raise ImportError("AsyncHost requires the asyncssh package. "
+                              "Install it with: pip install sheessh[async]")
+        self.host = host
+        self.conn = None
+        self._sftp = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def open(self):
+        """
+        Opens the SSH connection to the host, if it is not open yet.
+        :return:
+        """
+        if self.conn is not None:
+            return
+        ckw = {  # ckw = Connection Key Words
+            "port": self.host.port,
+            "username": self.host.user,
+            # same as fabric, unknown host keys are accepted
+            "known_hosts": None,
+            "keepalive_interval": self.host.keepalive,
+        }
+        if self.host.password:
+            ckw["password"] = self.host.password
+        if self.host.identity:
+            ckw["client_keys"] = [self.host.identity]
+        self.conn = await asyncssh.connect(self.host.ip if self.host.ip else self.host.hostname, **ckw)
+
+    async def close(self):
+        """
+        Closes the SSH connection to the host.
+        :return:
+        """
+        if self.conn is not None:
+            self.conn.close()
+            await self.conn.wait_closed()
+            self.conn = None
+            self._sftp = None
+
+    async def sftp(self):
+        """
+        SFTP client of the host connection. It is opened on first use and reused afterwards.
+        :return: asyncssh SFTPClient
+        """
+        await self.open()
+        if self._sftp is None:
+            self._sftp = await self.conn.start_sftp_client()
+        return self._sftp
+
+
+@_ttl_cache(10, key=lambda host: (id(host), host.ip or host.hostname, host.identity))
 def test_connection(host: Host):
     """
-    Tests whether connection can be established. If not, provides reason.
+    Tests whether connection can be established. If not, logs the reason.
+    Successful result is remembered for 10 seconds, so the function can be called
+    defensively before every operation without costing a round trip each time.
     :param host:
     :return:
     """
     try:
-        host.conn.run('echo "SSH connection successful"')
+        host.run('echo "SSH connection successful"', hide=True)
+        logger.debug("SSH connection to %s successful", host.hostname)
         return True
     except FileNotFoundError as e:
-        print(
-            f"SSH connection failed. Private key file not found {host.identity}")
+        logger.error("SSH connection failed. Private key file not found %s", host.identity)
         return False
     except TimeoutError as e:
-        print(f"SSH connection timed out. {e}")
+        logger.error("SSH connection timed out. %s", e)
         return False
     except (AuthFailure, BadAuthenticationType) as e:
-        print("Authentication failed: Check username, password and or correctness of identity file")
-        print(e)
+        logger.error("Authentication failed: Check username, password and or correctness of identity file\n%s", e)
+        return False
     except (UnexpectedExit, Exception) as e:
-        print(f"SSH connection failed: {type(e)}-{e}")
+        logger.error("SSH connection failed: %s-%s", type(e), e)
         return False
 
 
 def ssh(host: Host, comm: str, **kwargs):
     """
     Runs a command on specified host.
+    The command may modify any remote path, therefore all cached metadata of the host is dropped.
     :param host:
     :param comm:
     :param kwargs:
     :return:
     """
-    return host.run(comm, **kwargs)
+    try:
+        return host.run(comm, **kwargs)
+    finally:
+        host.clear_stat_cache()
 
 
 def touch(file_path):
@@ -177,8 +839,9 @@ def touch_remote(host: Host, path, hide: bool = True):
     :param hide: controls whether the output will be printed to stdout
     :return:
     """
-    remote_mkdir(host, os.path.dirname(path), hide=hide)
-    host.run(f"touch {path}", hide=hide)
+    dirname = os.path.dirname(path) or "."
+    host.run_fast(f"mkdir -p -- {_shq(dirname)} && touch -- {_shq(path)}", hide=hide)
+    host._cache_invalidate(path)
 
 
 def remote_mkdir(host: Host, path, hide: bool = True):
@@ -190,7 +853,80 @@ def remote_mkdir(host: Host, path, hide: bool = True):
     :param hide: controls whether the output will be printed to stdout
     :return:
     """
-    host.run(f"mkdir -p {path}", hide=hide)
+    host.run_fast(f"mkdir -p -- {_shq(path)}", hide=hide)
+    host._cache_invalidate(path)
+
+
+def _stat(host: Host, path, cache: bool = True) -> _RemoteStat:
+    """
+    Gets existence, type, size and last modified time of a remote path with a single SFTP request,
+    or from the host's cache. Follows symbolic links, like test or stat commands.
+    All the metadata functions of this module are built on top of it.
+    :param host: target host
+    :param path: target path
+    :param cache: if True, result cached by the host (see Host.stat_cache_ttl) may be returned
+    :return: _RemoteStat, exists is False if the path does not exist or is not accessible
+    """
+    path = os.fspath(path)
+    record = host._cache_get(path) if cache else None
+    if record is not None:
+        return record
+    try:
+        attr = host.sftp.stat(path)
+        record = _RemoteStat(True, stat.S_ISDIR(attr.st_mode), stat.S_ISREG(attr.st_mode),
+                             attr.st_size, attr.st_mtime)
+    except FileNotFoundError:
+        record = _MISSING
+    except PermissionError:
+        # Like test -e, a path under an unreadable directory doesn't exist for us.
+        # Not cached, the permissions may be fixed any time.
+        return _MISSING
+    host._cache_set(path, record)
+    return record
+
+
+def cache_remote_paths(host: Host, paths):
+    """
+    Fetches metadata of many remote paths with a single command and stores it in the host's cache
+    (see Host.stat_cache_ttl), so following metadata calls on these paths (remote_path_exists,
+    remote_is_dir, remote_file_info...) don't need a request each. Useful before checking
+    a long list of paths in a loop. The cache holds at most 1024 paths (_STAT_CACHE_SIZE),
+    longer lists have to be split into batches, otherwise ValueError is raised.
+    Does nothing, if the cache of the host is disabled.
+    :param host: target host
+    :param paths: iterable of remote paths
+    :return:
+    """
+    paths = list(paths)
+    if len(paths) > _STAT_CACHE_SIZE:
+        raise ValueError(f"Can't cache {len(paths)} paths, the cache holds at most {_STAT_CACHE_SIZE}")
+    if not paths or host.stat_cache_ttl <= 0:
+        return
+    # One line per path, in the order of the paths, so names don't need to be parsed
+    result = host.run_fast(f"for p in {' '.join(_shq(path) for path in paths)}; do "
+                           f"stat -L -c '%f|%s|%Y' -- \"$p\" 2>/dev/null || echo MISSING; done")
+    for path, line in zip(paths, result.stdout.splitlines()):
+        if line == "MISSING":
+            host._cache_set(path, _MISSING)
+            continue
+        mode, size, mtime = line.split("|")
+        mode = int(mode, 16)
+        host._cache_set(path, _RemoteStat(True, stat.S_ISDIR(mode), stat.S_ISREG(mode), int(size), int(mtime)))
+
+
+def _kind(host: Host, path) -> str:
+    """
+    Gets the type of a remote path from a single (cached) stat, see _stat.
+    :param host: target host
+    :param path: target path
+    :return: "file" (regular file), "dir", "other" (socket, device...) or "missing"
+    """
+    record = _stat(host, path)
+    if not record.exists:
+        return "missing"
+    if record.is_dir:
+        return "dir"
+    return "file" if record.is_file else "other"
 
 
 def remote_is_dir(host: Host, path, hide: bool = True) -> bool:
@@ -202,100 +938,203 @@ def remote_is_dir(host: Host, path, hide: bool = True) -> bool:
     :param hide: controls whether the output will be printed to stdout
     :return: bool
     """
-    if remote_path_exists(host, path):
-        test = host.run(f"test -d {path} && echo 0 || echo 1", hide=hide).stdout
-        return test.strip() == "0"
-    else:
+    kind = _kind(host, path)
+    if kind == "missing":
         raise FileNotFoundError(f"Error. Dir {host.hostname}:{path} does not exist")
+    return kind == "dir"
+
+
+def as_datetime(info) -> datetime:
+    """
+    Converts the last modified time in a dictionary returned by remote_file_info, remote_dir_info
+    or remote_path_info to datetime. The info functions keep the time as unix timestamp,
+    which is much cheaper when comparing times of many files.
+    :param info: dictionary returned by one of the info functions
+    :return: last modified date as datetime
+    """
+    return datetime.fromtimestamp(info["last_modified_epoch"])
 
 
-def remote_file_info(host: Host, path, hide: bool = True):
+def remote_file_info(host: Host, path, hide: bool = True, cache: bool = False):
     """
     Gets size and last modified time of a file on remote host.
     If the file does not exist or is a directory, FileNotFoundError is raised.
     :param host: target host
     :param path: path to the remote file
     :param hide:  controls whether the output will be printed to stdout
-    :return: dictionary containing the path, file size in bytes and last modified date ad datetime
+    :param cache: if True, result cached by the host (see Host.stat_cache_ttl) may be returned.
+        Off by default like in remote_path_info, the cached size misses changes of the file (e.g. growing logs)
+    :return: dictionary containing the path, file size in bytes and last modified time as unix timestamp
     """
-
-    if remote_path_exists(host, path, hide=hide):
-        if not remote_is_dir(host, path, hide=hide):
-            data = host.run(f'stat -c "%s %Y" "{path}"', hide=hide).stdout
-        else:
-            raise FileNotFoundError(f"Error. Path {host.hostname}:{path} is not a file")
-    else:
+    record = _stat(host, path, cache=cache)
+    if not record.exists:
         raise FileNotFoundError(f"Error. File {host.hostname}:{path} does not exist")
-
-    # try:
-    #     data = host.run(f'stat -c "%s %Y" "{path}"', hide=hide).stdout
-    # except UnexpectedExit as e:
-    #     print(f"Error getting remote file info. "
-    #           f"File {host.hostname}:{path} does not exist",
-    #           file=sys.stderr)
-    #     return None
-
-    # Neatly format data from strings to appropriate data types
-    size_str, timestamp_str = data.split()
-    size_bytes = int(size_str)
-    last_modified = datetime.fromtimestamp(int(timestamp_str))
+    if not record.is_file:
+        raise FileNotFoundError(f"Error. Path {host.hostname}:{path} is not a file")
 
     return {
         "path": path,
-        "size_bytes": size_bytes,
-        "last_modified": last_modified
+        "size_bytes": record.size,
+        "last_modified_epoch": record.mtime
     }
 
 
-def remote_dir_info(host, path, hide: bool = True):
+def _remote_dir_stat(host: Host, path, cache: bool = True) -> _RemoteStat:
+    """
+    Gets metadata of a remote directory.
+    If the directory does not exist or is a file, FileNotFoundError is raised.
+    :param host: target host
+    :param path: path to the remote directory
+    :param cache: if True, result cached by the host may be returned
+    :return: _RemoteStat
+    """
+    record = _stat(host, path, cache=cache)
+    if not record.exists:
+        raise FileNotFoundError(f"Error. File {host.hostname}:{path} does not exist")
+    if not record.is_dir:
+        raise FileNotFoundError(f"Error. Path {host.hostname}:{path} is not a directory")
+    return record
+
+
+def _dir_size(host: Host, path, mtime: int, hide: bool = True, cache: bool = True) -> int:
+    """
+    Gets size of a remote directory tree with du, or from the host's cache, if the modification
+    time of the directory didn't change since the size was cached.
+    :param host: target host
+    :param path: path to the remote directory
+    :param mtime: current modification time of the directory
+    :param hide: controls whether the output will be printed to stdout
+    :param cache: if True, cached size may be returned
+    :return: size of the directory tree in bytes
+    """
+    key = host._cache_key(path)
+    cached = host._dir_size_cache.get(key) if cache else None
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    # SFTP can't sum up the size of a directory tree
+    dir_size = int(host.run(f"du -sb -- {_shq(path)}", hide=hide).stdout.split("\t")[0])
+    _dir_size_store(host, key, mtime, dir_size)
+    return dir_size
+
+
+def _dir_size_store(host: Host, key, mtime: int, dir_size: int):
+    host._dir_size_cache[key] = (mtime, dir_size)
+    host._dir_size_cache.move_to_end(key)
+    if len(host._dir_size_cache) > _STAT_CACHE_SIZE:
+        host._dir_size_cache.popitem(last=False)
+
+
+def _dir_mtime_and_size(host: Host, path, hide: bool = True, cache: bool = True):
+    """
+    Gets the last modified time and the size of a remote directory tree. If the size is cached,
+    only the modification time is fetched (SFTP stat) to validate it. Otherwise, both are fetched
+    by a single command, since du has to be run anyway.
+    If the directory does not exist or is a file, FileNotFoundError is raised.
+    :param host: target host
+    :param path: path to the remote directory
+    :param hide: controls whether the output will be printed to stdout
+    :param cache: if True, cached size may be returned
+    :return: tuple (last modified time as unix timestamp, size of the directory tree in bytes)
+    """
+    key = host._cache_key(path)
+    if cache and key in host._dir_size_cache:
+        # The cached size is validated by a fresh modification time, not by a cached one
+        mtime = _remote_dir_stat(host, path, cache=False).mtime
+        return mtime, _dir_size(host, path, mtime, hide=hide)
+
+    result = host.run(f"test -d {_shq(path)} || exit {_EXIT_NOT_FOUND}; "
+                      f"stat -c %Y -- {_shq(path)} && du -sb -- {_shq(path)}", hide=hide, warn=True)
+    _raise_for_exit(result,
+                    not_found=f"Error. Directory {host.hostname}:{path} does not exist or is not a directory")
+    mtime, du = result.stdout.splitlines()[:2]
+    mtime, dir_size = int(mtime), int(du.split("\t")[0])
+    _dir_size_store(host, key, mtime, dir_size)
+    return mtime, dir_size
+
+
+def remote_dir_mtime(host: Host, path, cache: bool = True):
+    """
+    Gets the last modified time of a directory on remote host. Unlike remote_dir_info,
+    it doesn't need to go through the whole directory tree, so it is fast even for large directories.
+    If the directory does not exist or is a file, FileNotFoundError is raised.
+    :param host: target host
+    :param path: path to the remote directory
+    :param cache: if True, result cached by the host (see Host.stat_cache_ttl) may be returned.
+        Use cache=False when watching the directory for changes.
+    :return: last modified time as unix timestamp
+    """
+    return _remote_dir_stat(host, path, cache=cache).mtime
+
+
+def remote_dir_size(host: Host, path, hide: bool = True, cache: bool = True) -> int:
+    """
+    Gets the size of a directory tree on remote host. Computing the size requires going through
+    the whole tree on the remote host, which can take a while for large directories. Therefore,
+    the size is cached by the host, until the last modified time of the directory changes, or the
+    directory is modified by one of the functions of this module.
+    Note that modifications deeper in the tree don't change the modification time of the directory itself.
+    If this can happen (e.g. growing log files), use cache=False.
+    If the directory does not exist or is a file, FileNotFoundError is raised.
+    :param host: target host
+    :param path: path to the remote directory
+    :param hide: controls whether the output will be printed to stdout
+    :param cache: if True, cached size may be returned
+    :return: size of the directory tree in bytes
+    """
+    return _dir_mtime_and_size(host, path, hide=hide, cache=cache)[1]
+
+
+def remote_dir_info(host, path, hide: bool = True, cache: bool = False):
     """
         Gets the size and last modified time of a directory on remote host.
         If the direcotry does not exist or is a file, FileNotFoundError is raised.
+        If only one of them is needed, use remote_dir_mtime or remote_dir_size.
         :param host: target host
         :param path: path to the remote file
         :param hide:  controls whether the output will be printed to stdout
-        :return: dictionary containing the path, directory size in bytes and last modified date ad datetime
-        """
-    if remote_path_exists(host, path):
-        if remote_is_dir(host, path, hide=hide):
-            dir_size = host.run(f"du -sb {path}", hide=hide).stdout.split("\t")[0]
-            lm_ts = host.run(f'stat -c "%Y" "{path}"', hide=hide).stdout
-            last_modified = datetime.fromtimestamp(int(lm_ts))
-            return {
-                "path": path,
-                "size_bytes": int(dir_size),
-                "last_modified": last_modified
-            }
-        else:
-            raise FileNotFoundError(f"Error. Path {host.hostname}:{path} is not a directory")
-    else:
-        raise FileNotFoundError(f"Error. File {host.hostname}:{path} does not exist")
+        :param cache: if True, cached size may be returned, see remote_dir_size. Off by default,
+            the cached size misses changes of files inside the directory (e.g. growing logs)
+        :return: dictionary containing the path, directory size in bytes and last modified time as unix timestamp
+        """
+    mtime, dir_size = _dir_mtime_and_size(host, path, hide=hide, cache=cache)
+    return {
+        "path": path,
+        "size_bytes": dir_size,
+        "last_modified_epoch": mtime
+    }
 
 
-def remote_path_info(host: Host, path, hide: bool = True):
+def remote_path_info(host: Host, path, hide: bool = True, cache: bool = False):
     """
     Returns the size and last modified time of either a file or directory.
     If the path does not exist, FileNotFoundError is raised.
     The function returns dictionary containing:
         *path,
         *size in bytes
-        *last modified date as datetime
+        *last modified time as unix timestamp
         *is_dir, bool that specifies whether the path is a dir or not
     :param host: target host
     :param path: target path
     :param hide: controls whether the output will be printed to stdout
+    :param cache: if True, result cached by the host (see Host.stat_cache_ttl) may be returned,
+        including cached directory size (see remote_dir_size). Off by default, the cached size
+        misses changes of files inside the directory (e.g. growing logs)
     :return: dict
     """
-    if remote_path_exists(host, path, hide=hide):
-        if remote_is_dir(host, path, hide=hide):
-            data = remote_dir_info(host, path, hide=hide)
-            data["is_dir"] = True
-        else:
-            data = remote_file_info(host, path, hide=hide)
-            data["is_dir"] = False
-        return data
-    else:
+    record = _stat(host, path, cache=cache)
+    if not record.exists:
         raise FileNotFoundError(f"Error. Path {host.hostname}:{path} does not exist")
+    if record.is_dir:
+        size = _dir_size(host, path, record.mtime, hide=hide, cache=cache)
+    else:
+        size = record.size
+    return {
+        "path": path,
+        "size_bytes": size,
+        "last_modified_epoch": record.mtime,
+        "is_dir": record.is_dir
+    }
 
 
 def remote_file_exists(host: Host, path, hide: bool = True):
@@ -306,8 +1145,7 @@ def remote_file_exists(host: Host, path, hide: bool = True):
     :param hide: controls whether the output will be printed to stdout
     :return: bool
     """
-    tst = host.run(f"test -f {path} && echo 0 || echo 1", hide=hide).stdout.strip()
-    return tst == "0"
+    return _kind(host, path) == "file"
 
 
 def remote_dir_exists(host, path, hide: bool = True):
@@ -318,8 +1156,7 @@ def remote_dir_exists(host, path, hide: bool = True):
     :param hide: controls whether the output will be printed to stdout
     :return: bool
     """
-    tst = host.run(f"test -d {path} && echo 0 || echo 1", hide=hide).stdout.strip()
-    return tst == "0"
+    return _kind(host, path) == "dir"
 
 
 def remote_path_exists(host, path, hide: bool = True):
@@ -330,8 +1167,7 @@ def remote_path_exists(host, path, hide: bool = True):
     :param hide: controls whether the output will be printed to stdout
     :return: bool
     """
-    tst = host.run(f"test -e {path} && echo 0 || echo 1", hide=hide).stdout.strip()
-    return tst == "0"
+    return _kind(host, path) != "missing"
 
 
 def rename_remote_file(host, file, new_name, overwrite: bool = True, hide: bool = True):
@@ -345,18 +1181,21 @@ def rename_remote_file(host, file, new_name, overwrite: bool = True, hide: bool
     :param hide: controls whether the output will be printed to stdout
     :return: None
     """
-    if remote_path_exists(host, file, hide=hide):
-        dirname = os.path.dirname(file)
-        new_path = f"{dirname}/{new_name}"
-        if overwrite:
-            host.run(f"mv {file} {new_path}", hide=hide)
-        else:
-            if remote_file_exists(host, new_path, hide=hide):
-                raise FileExistsError(f"Error renaming remote file. \n"
-                                      f"File {host.hostname}:{new_path} already exists!")
-    else:
-        raise FileNotFoundError(f"Error renaming remote file. \n"
-                                f"File {host.hostname}:{file} does not exist!")
+    dirname = os.path.dirname(file)
+    new_path = f"{dirname}/{new_name}"
+
+    cmd = f"test -e {_shq(file)} || exit {_EXIT_NOT_FOUND}; "
+    if not overwrite:
+        cmd += f"test -f {_shq(new_path)} && exit {_EXIT_EXISTS}; "
+    cmd += f"mv -- {_shq(file)} {_shq(new_path)}"
+
+    result = host.run_fast(cmd, hide=hide, warn=True)
+    host._cache_invalidate(file, new_path)
+    _raise_for_exit(result,
+                    not_found=f"Error renaming remote file. \n"
+                              f"File {host.hostname}:{file} does not exist!",
+                    exists=f"Error renaming remote file. \n"
+                           f"File {host.hostname}:{new_path} already exists!")
 
 
 def rename_remote_dir(host, rdir, new_name, hide: bool = True):
@@ -369,20 +1208,20 @@ def rename_remote_dir(host, rdir, new_name, hide: bool = True):
     :param hide:
     :return:
     """
-    if remote_path_exists(host, rdir, hide=hide):
-        # add the trailing / denoting a directory in case it's not there
-        if not rdir[-1] == "/":
-            rdir += "/"
-        new_path = rdir.split('/')[:-2] + [new_name]
-        new_path = "/".join(new_path)
-        if remote_dir_exists(host, new_path, hide=hide):
-            raise FileExistsError(f"Error renaming remote directory. \n"
-                                  f"Directory {host.hostname}:{new_path} already exists!")
-        else:
-            host.run(f"mv {rdir} {new_path}", hide=True)
-    else:
-        raise FileNotFoundError(f"Error renaming remote directory. \n"
-                                f"Directory {host.hostname}:{rdir} does not exist!")
+    # add the trailing / denoting a directory in case it's not there
+    if not rdir[-1] == "/":
+        rdir += "/"
+    new_path = str(PurePosixPath(rdir.rstrip("/")).parent / new_name)
+
+    result = host.run_fast(f"test -e {_shq(rdir)} || exit {_EXIT_NOT_FOUND}; "
+                           f"test -d {_shq(new_path)} && exit {_EXIT_EXISTS}; "
+                           f"mv -- {_shq(rdir)} {_shq(new_path)}", hide=hide, warn=True)
+    host._cache_invalidate(rdir, new_path)
+    _raise_for_exit(result,
+                    not_found=f"Error renaming remote directory. \n"
+                              f"Directory {host.hostname}:{rdir} does not exist!",
+                    exists=f"Error renaming remote directory. \n"
+                           f"Directory {host.hostname}:{new_path} already exists!")
 
 
 def move_remote_file(host: Host, src, dest, overwrite: bool = True, hide: bool = True):
@@ -395,17 +1234,20 @@ def move_remote_file(host: Host, src, dest, overwrite: bool = True, hide: bool =
     :param hide:
     :return:
     """
+    dirname = os.path.dirname(dest) or "."
 
-    if remote_file_exists(host, src, hide=hide):
-        if remote_file_exists(host, dest, hide=True):
-            if not overwrite:
-                raise FileExistsError(f"Error moving remote file. \n"
-                                      f"Destination file {host.hostname}:{dest} already exists")
-        touch_remote(host, dest, hide=hide)  # make sure file and dirs exits
-        host.run(f"mv {src} {dest}", hide=hide)
-    else:
-        raise FileNotFoundError(f"Error moving remote file. \n"
-                                f"File {host.hostname}:{src} does not exist!")
+    cmd = f"test -f {_shq(src)} || exit {_EXIT_NOT_FOUND}; "
+    if not overwrite:
+        cmd += f"test -f {_shq(dest)} && exit {_EXIT_EXISTS}; "
+    cmd += f"mkdir -p -- {_shq(dirname)} && mv -- {_shq(src)} {_shq(dest)}"  # make sure dirs exist
+
+    result = host.run_fast(cmd, hide=hide, warn=True)
+    host._cache_invalidate(src, dest)
+    _raise_for_exit(result,
+                    not_found=f"Error moving remote file. \n"
+                              f"File {host.hostname}:{src} does not exist!",
+                    exists=f"Error moving remote file. \n"
+                           f"Destination file {host.hostname}:{dest} already exists")
 
 
 def move_remote_dir(host: Host, src, dest, hide: bool = True):
@@ -423,15 +1265,15 @@ def move_remote_dir(host: Host, src, dest, hide: bool = True):
     if dest[-1] != "/":
         dest += "/"
 
-    if remote_dir_exists(host, src, hide=hide):
-        if remote_dir_exists(host, dest, hide=hide):
-            raise FileExistsError(f"Error moving remote directory. \n"
-                                  f"Destination directory {host.hostname}:{dest} already exists")
-        remote_mkdir(host, dest, hide=hide)  # make sure file and dirs exits
-        host.run(f"mv {src} {dest}", hide=hide)
-    else:
-        raise FileNotFoundError(f"Error moving remote file. \n"
-                                f"File {host.hostname}:{src} does not exist!")
+    result = host.run_fast(f"test -d {_shq(src)} || exit {_EXIT_NOT_FOUND}; "
+                           f"test -d {_shq(dest)} && exit {_EXIT_EXISTS}; "
+                           f"mkdir -p -- {_shq(dest)} && mv -- {_shq(src)} {_shq(dest)}", hide=hide, warn=True)
+    host._cache_invalidate(src, dest)
+    _raise_for_exit(result,
+                    not_found=f"Error moving remote file. \n"
+                              f"File {host.hostname}:{src} does not exist!",
+                    exists=f"Error moving remote directory. \n"
+                           f"Destination directory {host.hostname}:{dest} already exists")
 
 
 def copy_remote_file(host: Host, src, dest, overwirte=True, hide: bool = True):
@@ -444,17 +1286,20 @@ def copy_remote_file(host: Host, src, dest, overwirte=True, hide: bool = True):
     :param hide: controls whether the output will be printed to stdout
     :return:
     """
+    dirname = os.path.dirname(dest) or "."
 
-    if remote_file_exists(host, src, hide=hide):
-        if remote_file_exists(host, dest, hide=True):
-            if not overwirte:
-                raise FileExistsError(f"Error copying remote file. \n"
-                                      f"Destination file {host.hostname}:{dest} already exists")
-        touch_remote(host, dest, hide=hide)  # make sure file and dirs exits
-        host.run(f"cp {src} {dest}", hide=hide)
-    else:
-        raise FileNotFoundError(f"Error cp remote file. \n"
-                                f"File {host.hostname}:{src} does not exist!")
+    cmd = f"test -f {_shq(src)} || exit {_EXIT_NOT_FOUND}; "
+    if not overwirte:
+        cmd += f"test -f {_shq(dest)} && exit {_EXIT_EXISTS}; "
+    cmd += f"mkdir -p -- {_shq(dirname)} && cp -- {_shq(src)} {_shq(dest)}"  # make sure dirs exist
+
+    result = host.run_fast(cmd, hide=hide, warn=True)
+    host._cache_invalidate(dest)
+    _raise_for_exit(result,
+                    not_found=f"Error cp remote file. \n"
+                              f"File {host.hostname}:{src} does not exist!",
+                    exists=f"Error copying remote file. \n"
+                           f"Destination file {host.hostname}:{dest} already exists")
 
 
 def copy_remote_dir(host, src, dest, hide: bool = True):
@@ -472,15 +1317,15 @@ def copy_remote_dir(host, src, dest, hide: bool = True):
     if dest[-1] != "/":
         dest += "/"
 
-    if remote_dir_exists(host, src, hide=hide):
-        if remote_dir_exists(host, dest, hide=hide):
-            raise FileExistsError(f"Error copying remote directory. \n"
-                                  f"Destination directory {host.hostname}:{dest} already exists")
-        remote_mkdir(host, dest, hide=hide)  # make sure file and dirs exits
-        host.run(f"cp -r {src} {dest}", hide=hide)
-    else:
-        raise FileNotFoundError(f"Error moving remote file. \n"
-                                f"File {host.hostname}:{src} does not exist!")
+    result = host.run_fast(f"test -d {_shq(src)} || exit {_EXIT_NOT_FOUND}; "
+                           f"test -d {_shq(dest)} && exit {_EXIT_EXISTS}; "
+                           f"mkdir -p -- {_shq(dest)} && cp -r -- {_shq(src)} {_shq(dest)}", hide=hide, warn=True)
+    host._cache_invalidate(dest)
+    _raise_for_exit(result,
+                    not_found=f"Error moving remote file. \n"
+                              f"File {host.hostname}:{src} does not exist!",
+                    exists=f"Error copying remote directory. \n"
+                           f"Destination directory {host.hostname}:{dest} already exists")
 
 
 def download_file(host: Host, rem_file, dest=None, overwrite=True):
@@ -495,95 +1340,297 @@ def download_file(host: Host, rem_file, dest=None, overwrite=True):
     :param overwrite: if True, overwrite existing destination file
     :return:
     """
-    if remote_file_exists(host, rem_file):
-        if dest is None:
-            # If no destination path is provided, download to user's download directory
-            dl_dir = Path.home() / "Downloads"
-            fname = Path(rem_file).name
-            dest = Path(dl_dir, fname)
-        else:
-            # Destination has been provided. Now it needs to be checked
-            # whether the destination exists.
-            if not os.path.exists(dest):
-                # If the dest does not exist, we need to decide whether it's a directory
-                # a or file: if the dest ends with / or \, it denotes a directory path
-                if dest[-1] == "/" or dest[-1] == "\\":
-                    # if dest is directory, keep original file name
-                    fname = Path(rem_file).name
-                    dest = Path(dest, fname)
-                # else, dest is already a file
-            else:
-                # if dest exist, it might be a dir, therfore we keep the original name
-                if os.path.isdir(dest):
-                    fname = Path(rem_file).name
-                    dest = Path(dest, fname)
-                # else, dest is file, and will be dealt with according to overwrite
-        if overwrite:
-            host.download(rem_file, dest=str(dest))
-        else:
-            raise FileExistsError(f"Error downloading file. \n"
-                                  f"Destination file {dest} already exists")
-    else:
+    # The stat is the existence check, its result is reused by the download itself
+    try:
+        attr = host.sftp.stat(rem_file)
+    except FileNotFoundError:
+        attr = None
+    if attr is None or not stat.S_ISREG(attr.st_mode):
         raise FileNotFoundError(f"Error downloading file. \n"
                                 f"File {host.hostname}:{rem_file} does not exist!")
 
+    dest = _local_dest(rem_file, dest)
+    if not overwrite and dest.exists():
+        raise FileExistsError(f"Error downloading file. \n"
+                              f"Destination file {dest} already exists")
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    _download(host, rem_file, dest, attr)
+
 
-def download_dir(host: Host, rem_path, dest_path=None):
+def download_dir(host: Host, rem_path, dest_path=None, workers: int = 6, skip_unchanged: bool = True):
     """
     Download a remote directory from remote host. Default destination is user's download directory.
     Necessary subdirectories will be created.
+    The files are downloaded in parallel, every worker uses its own SFTP session (SSH channel)
+    multiplexed over the connection of the host, so no extra SSH handshakes are needed.
+    The sessions count towards the MaxSessions limit of the remote sshd (10 by default) together
+    with the other channels of the host (SFTP client, the streamed listing, the persistent shell).
+    If the limit is reached, the download continues with the sessions opened so far.
+    Downloaded files get the modification time of the remote files. Files which were already
+    downloaded and didn't change since then (same size and modification time) are skipped,
+    so an interrupted download can be resumed by calling the function again.
     :param host: target host
     :param rem_path: path to remote directory
     :param dest_path: path to local directory where the remote directory will be downloaded
+    :param workers: maximum number of parallel downloads
+    :param skip_unchanged: if False, all files are downloaded even if the local copy is up-to-date
     :return:
     """
-    if remote_dir_exists(host, rem_path):
-        if remote_is_dir(host, rem_path):
-            pass
-        else:
-            raise FileNotFoundError(f"Error downloading directory. \n"
-                                    f"Remote directory {host.hostname}:{rem_path} is not a directory")
-    else:
+    rem_path = os.fspath(rem_path)
+    record = _stat(host, rem_path)
+    if not record.exists:
         raise FileNotFoundError(f"Error downloading directory. \n"
                                 f"Remote directory {host.hostname}:{rem_path} does not exist!")
+    if not record.is_dir:
+        raise FileNotFoundError(f"Error downloading directory. \n"
+                                f"Remote directory {host.hostname}:{rem_path} is not a directory")
+
+    if dest_path is None:
+        dirname = os.path.basename(os.path.normpath(rem_path))
+        dest_path = Path.home() / "Downloads" / dirname
+
+    # SFTP session must not be used by two threads at once, therefore a worker takes an idle session,
+    # or opens a new one on the shared transport. When the server refuses more sessions,
+    # the workers wait for the idle ones instead.
+    sessions = []
+    idle = queue.SimpleQueue()
+    sessions_lock = threading.Lock()
+    session_limit = [max(1, workers)]
+    host.open()
+
+    def acquire_session():
+        try:
+            return idle.get_nowait()
+        except queue.Empty:
+            pass
+        with sessions_lock:
+            if len(sessions) < session_limit[0]:
+                try:
+                    sessions.append(host.conn.client.open_sftp())
+                    return sessions[-1]
+                except ChannelException:
+                    if not sessions:
+                        raise
+                    logger.info("%s refused more SFTP sessions, downloading with %d",
+                                host.hostname or host.ip, len(sessions))
+                    session_limit[0] = len(sessions)
+        return idle.get()
+
+    def download(remote_file, local_file_path, attr):
+        if skip_unchanged and _local_unchanged(local_file_path, attr):
+            return
+        sftp = acquire_session()
+        try:
+            _sftp_get(sftp, remote_file, local_file_path, attr)
+        finally:
+            idle.put(sftp)
+
+    # The tree is walked by a single find, whose output is streamed. Directories are created and files
+    # are handed over to the workers while the walk is still running. A directory is always listed
+    # before its content, so the local directory exists before any of its files is downloaded.
+    # For the same reason, only the destination itself needs its missing ancestors created,
+    # subdirectories are created with a single mkdir.
+    Path(dest_path).mkdir(parents=True, exist_ok=True)
+    # Remote paths are POSIX, so the relative path is sliced off the walked path instead of using
+    # os.path.relpath, which follows the rules of the local system (and normalizes every path)
+    prefix_len = len(rem_path.rstrip("/")) + 1
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = []
+            try:
+                for remote_path, attr in _walk_find(host, rem_path):
+                    local_path = os.path.join(dest_path, remote_path[prefix_len:].replace("/", os.sep))
+                    if stat.S_ISDIR(attr.st_mode):
+                        Path(local_path).mkdir(exist_ok=True)
+                    else:
+                        futures.append(executor.submit(download, remote_path, local_path, attr))
+
+                for future in as_completed(futures):
+                    future.result()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        for sftp in sessions:
+            sftp.close()
+
+
+def _tar_filter(member, path):
+    """
+    Extraction filter of download_dir_stream. Applies tarfile.data_filter, but links and special files
+    it refuses (e.g. absolute symbolic links, links pointing outside the destination, devices)
+    are skipped instead of aborting the extraction, like download_dir skips them.
+    :param member: TarInfo of the extracted member
+    :param path: destination directory
+    :return: TarInfo to be extracted, None to skip the member
+    """
+    try:
+        return tarfile.data_filter(member, path)
+    except tarfile.FilterError:
+        if member.isfile() or member.isdir():
+            raise
+        return None
+
 
+def download_dir_stream(host: Host, rem_path, dest_path=None):
+    """
+    Download a remote directory from remote host as a single tar stream, which is extracted
+    on the fly. Unlike download_dir, there is no per-file round trip and no archive is stored
+    on either side, which makes it much faster for directories with many small files.
+    Symbolic links and special files which can't be safely extracted are skipped, see _tar_filter.
+    If tar is not available on the remote host, it falls back to download_dir.
+    :param host: target host
+    :param rem_path: path to remote directory
+    :param dest_path: path to local directory where the content of the remote directory will be extracted
+    :return:
+    """
     if dest_path is None:
         dirname = os.path.basename(os.path.normpath(rem_path))
         dest_path = Path.home() / "Downloads" / dirname
 
-    # Step 1: Get all directories and create them locally
-    dir_result = host.run(f"find {rem_path} -type d", hide=True)
-    remote_dirs = dir_result.stdout.strip().split('\n')
+    not_found = (f"Error downloading directory. \n"
+                 f"Remote directory {host.hostname}:{rem_path} does not exist!")
+    cmd = f"test -d {_shq(rem_path)} || exit {_EXIT_NOT_FOUND}; tar -C {_shq(rem_path)} -cf - ."
+    chan = host.exec_channel(cmd)
+    try:
+        try:
+            # the tar stream is read lazily, so the destination is not created if the check fails
+            with tarfile.open(fileobj=chan.makefile("rb"), mode="r|") as tar:
+                os.makedirs(dest_path, exist_ok=True)
+                tar.extractall(dest_path, filter=_tar_filter)
+        except tarfile.ReadError:
+            # tar failed before producing any output, e.g. it is not installed
+            result = _channel_result(chan, cmd)
+            if result.exited == 127:
+                return download_dir(host, rem_path, dest_path)
+            _raise_for_exit(result, not_found=not_found)
+            raise
+        _raise_for_exit(_channel_result(chan, cmd), not_found=not_found)
+    finally:
+        chan.close()
+
+
+def _rsync_available(host: Host) -> bool:
+    """
+    Checks whether download_dir_rsync can be used: rsync and ssh must be available locally,
+    rsync on the remote host, and the authentication must not rely on password, which can't be
+    passed to the ssh client. Windows paths are not understood by rsync, so it is never used there.
+    The remote host is asked only once, the result is remembered by the host.
+    :param host: target host
+    :return: bool
+    """
+    if os.name == "nt" or (host.password and not host.identity):
+        return False
+    if shutil.which("rsync") is None or shutil.which("ssh") is None:
+        return False
+    if host._has_rsync is None:
+        host._has_rsync = host.run_fast("command -v rsync", warn=True).ok
+    return host._has_rsync
 
-    for remote_subdir in remote_dirs:
-        relative_path = os.path.relpath(remote_subdir, rem_path)
-        local_subdir = os.path.join(dest_path, relative_path)
-        os.makedirs(local_subdir, exist_ok=True)
-        # print(f"Created local directory: {local_subdir}")
 
-    # Step 2: Get all files and download them
-    file_result = host.run(f"find {rem_path} -type f", hide=True)
-    remote_files = file_result.stdout.strip().split('\n')
+def download_dir_rsync(host: Host, rem_path, dest_path=None):
+    """
+    Download a remote directory from remote host using rsync over ssh. Only files which changed
+    since the last download are transferred, and only their changed parts, which makes repeated
+    downloads of the same directory very fast. Default destination is user's download directory.
+    Necessary subdirectories will be created.
+    Falls back to download_dir, if rsync can't be used (see _rsync_available).
+    :param host: target host
+    :param rem_path: path to remote directory
+    :param dest_path: path to local directory where the remote directory will be downloaded
+    :return:
+    """
+    rem_path = os.fspath(rem_path)
+    if dest_path is None:
+        dirname = os.path.basename(os.path.normpath(rem_path))
+        dest_path = Path.home() / "Downloads" / dirname
+
+    if not _rsync_available(host):
+        return download_dir(host, rem_path, dest_path)
+
+    _remote_dir_stat(host, rem_path)  # raises FileNotFoundError if it's not a directory
+
+    ssh_cmd = ["ssh", "-p", str(host.port), "-o", "StrictHostKeyChecking=accept-new", "-o", "BatchMode=yes"]
+    if host.identity:
+        ssh_cmd += ["-i", host.identity]
+    # The ssh master connection outlives rsync, so the following downloads from the same host,
+    # even by other processes, skip the SSH handshake
+    control_dir = Path.home() / ".ssh"
+    control_dir.mkdir(mode=0o700, exist_ok=True)
+    ssh_cmd += ["-o", "ControlMaster=auto", "-o", f"ControlPersist={_SSH_CONTROL_PERSIST}",
+                "-o", f"ControlPath={control_dir / 'sheessh-%C'}"]
 
-    for remote_file in remote_files:
-        relative_path = os.path.relpath(remote_file, rem_path)
-        local_file_path = os.path.join(dest_path, relative_path)
-        host.download(remote_file, dest=local_file_path)
-        # print(f"Downloaded: {remote_file} → {local_file_path}")
+    Path(dest_path).mkdir(parents=True, exist_ok=True)
+    subprocess.run(["rsync", "-az", "--partial", "--inplace", "--protect-args",
+                    "-e", shlex.join(ssh_cmd),
+                    f"{host.user}@{host.ip if host.ip else host.hostname}:{rem_path.rstrip('/')}/",
+                    f"{dest_path}/"],
+                   check=True)
+
+
+async def download_dir_async(host: Host, rem_path, dest_path=None):
+    """
+    Asynchronous version of download_dir, requires the optional asyncssh package.
+    The whole tree is transferred over a single connection, asyncssh keeps many SFTP read
+    requests in flight at once, across files as well as within each file.
+    Default destination is user's download directory. Necessary subdirectories will be created.
+    :param host: target host
+    :param rem_path: path to remote directory
+    :param dest_path: path to local directory where the remote directory will be downloaded
+    :return:
+    """
+    rem_path = os.fspath(rem_path)
+    if dest_path is None:
+        dirname = os.path.basename(os.path.normpath(rem_path))
+        dest_path = Path.home() / "Downloads" / dirname
+
+    async with AsyncHost(host) as ahost:
+        sftp = await ahost.sftp()
+        if not await sftp.exists(rem_path):
+            raise FileNotFoundError(f"Error downloading directory. \n"
+                                    f"Remote directory {host.hostname}:{rem_path} does not exist!")
+        if not await sftp.isdir(rem_path):
+            raise FileNotFoundError(f"Error downloading directory. \n"
+                                    f"Remote directory {host.hostname}:{rem_path} is not a directory")
+
+        # Download the content of rem_path into dest_path, like download_dir does
+        Path(dest_path).mkdir(parents=True, exist_ok=True)
+        names = [name for name in await sftp.listdir(rem_path) if name not in (".", "..")]
+        if names:
+            rem_dir = rem_path.rstrip("/")
+            await sftp.mget([f"{rem_dir}/{name}" for name in names],
+                            str(dest_path), recurse=True, preserve=True)
+
+
+def download_dir_pipelined(host: Host, rem_path, dest_path=None):
+    """
+    Synchronous wrapper of download_dir_async, requires the optional asyncssh package.
+    Must not be called from a running event loop, await download_dir_async there instead.
+    :param host: target host
+    :param rem_path: path to remote directory
+    :param dest_path: path to local directory where the remote directory will be downloaded
+    :return:
+    """
+    asyncio.run(download_dir_async(host, rem_path, dest_path))
 
 
 def delete_remote_file(host:Host, path):
     """
     Deletes a remote file if it exists on the host. If not, FileNotFound Error will be raised.
+    If the path is a directory, IsADirectoryError is raised.
     :param host: target host
     :param path: path to file to be deleted
     :return:
     """
-    if remote_file_exists(host, path):
-        host.run(f"rm {path}")
-    else:
-        raise FileNotFoundError(f"Error deleting remote file. \n"
-                                f"File {host.hostname}:{path} does not exist")
+    result = host.run_fast(f"test -e {_shq(path)} || exit {_EXIT_NOT_FOUND}; "
+                           f"test -d {_shq(path)} && exit {_EXIT_IS_DIR}; rm -- {_shq(path)}", warn=True)
+    host._cache_invalidate(path)
+    _raise_for_exit(result,
+                    not_found=f"Error deleting remote file. \n"
+                              f"File {host.hostname}:{path} does not exist",
+                    is_dir=f"Error deleting remote file. \n"
+                           f"Path {host.hostname}:{path} is a directory")
 
 
 def delete_remote_dir(host:Host, path):
@@ -593,25 +1640,30 @@ def delete_remote_dir(host:Host, path):
     :param path:
     :return:s
     """
-    if remote_dir_exists(host, path):
-        host.run(f"rm -rf {path}")
-    else:
-        raise FileNotFoundError(f"Error deleting remote directory."
-                                f"Directory {host.hostname}:{path} does not exist")
+    result = host.run_fast(f"test -d {_shq(path)} || exit {_EXIT_NOT_FOUND}; rm -rf -- {_shq(path)}", warn=True)
+    host._cache_invalidate(path)
+    _raise_for_exit(result,
+                    not_found=f"Error deleting remote directory."
+                              f"Directory {host.hostname}:{path} does not exist")
 
 
 def truncate_remote_file(host:Host, path):
     """
-    Truncates (deletes content) of a file on a remote host if it exists
+    Truncates (deletes content) of a file on a remote host if it exists. If not, FileNotFoundError
+    is raised. If the path is a directory, IsADirectoryError is raised.
     :param host: target host
     :param path: path to file to be truncated
     :return:
     """
-    if remote_file_exists(host, path):
-        host.run(f"truncate --size 0 {path}")
-    else:
-        raise FileNotFoundError(f"Error truncating remote file."
-                                f"File {host.hostname}:{path} does not exist")
+    result = host.run_fast(f"test -e {_shq(path)} || exit {_EXIT_NOT_FOUND}; "
+                           f"test -d {_shq(path)} && exit {_EXIT_IS_DIR}; truncate --size 0 -- {_shq(path)}",
+                           warn=True)
+    host._cache_invalidate(path)
+    _raise_for_exit(result,
+                    not_found=f"Error truncating remote file."
+                              f"File {host.hostname}:{path} does not exist",
+                    is_dir=f"Error truncating remote file."
+                           f"Path {host.hostname}:{path} is a directory")
 
 def delete_remote_dir_content(host:Host, path):
     """
@@ -620,11 +1672,11 @@ def delete_remote_dir_content(host:Host, path):
     :param path: path to directory to be deleted
     :return:
     """
-    if remote_dir_exists(host, path):
-        host.run(f"rm -rf {path}/*")
-    else:
-        raise FileNotFoundError(f"Error deleting remote directory content."
-                                f"Directory {host.hostname}:{path} does not exist")
+    result = host.run_fast(f"test -d {_shq(path)} || exit {_EXIT_NOT_FOUND}; rm -rf -- {_shq(path)}/*", warn=True)
+    host._cache_invalidate(path)
+    _raise_for_exit(result,
+                    not_found=f"Error deleting remote directory content."
+                              f"Directory {host.hostname}:{path} does not exist")
 
 
 def upload_file(host:Host, file, rem_dest):
@@ -642,6 +1694,7 @@ def upload_file(host:Host, file, rem_dest):
             rem_dest = rem_dest[:-1] + fname
         # else, rem_dest is file and can be used for upload
         host.upload(file, rem_dest)
+        host._cache_invalidate(rem_dest)
 
     else:
         raise FileNotFoundError(f"Error uploading file. \nFile {file} does not exist")
@@ -653,44 +1706,96 @@ def upload_dir(host:Host, local_dir, dest_dir):
     pass
 
 
-def zip_remote_dir(host:Host, dir_path):
+def _remote_compressor(host: Host):
+    """
+    Finds the preferred compressor from _COMPRESSORS available on the remote host.
+    The host is asked only once, the result is remembered by the host.
+    :param host: target host
+    :return: name of the compressor, or None if none of them is available
+    """
+    if host._compressor is None:
+        result = host.run_fast(f"for c in {' '.join(_COMPRESSORS)}; do "
+                               f"command -v $c >/dev/null && echo $c && break; done; true", hide=True)
+        host._compressor = result.stdout.strip()
+    return host._compressor or None
+
+
+def _tar_create_opts(host: Host, compress: bool = True):
+    """
+    Builds tar options for creating an archive, compressed by the preferred compressor
+    available on the remote host. The options have to be followed by the archive path (or - for stdout).
+    :param host: target host
+    :param compress: if False, the archive is not compressed
+    :return: tuple (tar options, archive extension)
+    """
+    compressor = _remote_compressor(host) if compress else None
+    if compressor:
+        program, extension = _COMPRESSORS[compressor]
+        return f"--use-compress-program={_shq(program)} -cf", extension
+    return "-cf", ".tar"
+
+
+def zip_remote_dir(host:Host, dir_path, compress: bool = True):
     """
     Creates an archive (tar) of a directory and stores in "next to" the target directory.
     E.g. if dir_path = /mnt/data/logs/ , this function will create an archive that contains
     the logs directory and store the archive as /mnt/data/logs.tar
+
+    If compress is True and zstd or pigz is available on the host, the archive is compressed
+    using all CPU cores of the host and stored as logs.tar.zst or logs.tar.gz respectively.
     :param host:
     :param dir_path:
+    :param compress: if True, compress the archive if possible
     :return: path of the created archive.
     """
-    if not remote_path_exists(host, dir_path):
-        raise FileNotFoundError(f"Error creating archive. \n"
-                                f"Directory {host.hostname}:{dir_path} does not exist")
-    if not remote_is_dir(host, dir_path):
-        raise FileNotFoundError(f"Error creating archive. \n"
-                                f"{host.hostname}:{dir_path} is not directory")
-
     if dir_path[-1] != "/":
         dir_path = dir_path + "/"
 
-    tar_fname = os.path.basename(os.path.normpath(dir_path)) + ".tar"
+    tar_opts, extension = _tar_create_opts(host, compress)
+    tar_fname = os.path.basename(os.path.normpath(dir_path)) + extension
     tar_dir = "/".join(dir_path.split("/")[:-2])
     tar_path = "/".join([tar_dir, tar_fname])
-    host.run(f"tar -a -cf {tar_path} -C {dir_path} .")
+    result = host.run(f"test -d {_shq(dir_path)} || exit {_EXIT_NOT_FOUND}; "
+                      f"tar {tar_opts} {_shq(tar_path)} -C {_shq(dir_path)} .", warn=True)
+    host._cache_invalidate(tar_path)
+    _raise_for_exit(result,
+                    not_found=f"Error creating archive. \n"
+                              f"Directory {host.hostname}:{dir_path} does not exist or is not a directory")
     return tar_path
 
 
-def zip_and_download(host:Host, remote_dir, dest=None):
+def zip_and_download(host:Host, remote_dir, dest=None, compress: bool = True):
     """
     Zips and a remote directory and downloads the resulting archive to local machine.
+    The archive is streamed directly into the local file while it is being created,
+    it is never stored on the remote host. The archive is named and compressed the same
+    way as by zip_remote_dir. Destination is handled the same way as by download_file.
     :param host:
     :param remote_dir:
     :param dest:
-    :return:
+    :param compress: if True, compress the archive if possible
+    :return: local path of the downloaded archive
     """
-    # if dest is None:
-    #     dest = Path.home() / "Downloads"
-    archive = zip_remote_dir(host, remote_dir)
-    download_file(host, archive, dest)
+    tar_opts, extension = _tar_create_opts(host, compress)
+    archive = _local_dest(os.path.basename(os.path.normpath(remote_dir)) + extension, dest)
+    os.makedirs(archive.parent, exist_ok=True)
+
+    cmd = (f"test -d {_shq(remote_dir)} || exit {_EXIT_NOT_FOUND}; "
+           f"tar {tar_opts} - -C {_shq(remote_dir)} .")
+    chan = host.exec_channel(cmd)
+    try:
+        with open(archive, "wb") as f:
+            _channel_copy(chan, f)
+        result = _channel_result(chan, cmd)
+    finally:
+        chan.close()
+
+    if result.failed:
+        os.remove(archive)
+    _raise_for_exit(result,
+                    not_found=f"Error creating archive. \n"
+                              f"Directory {host.hostname}:{remote_dir} does not exist or is not a directory")
+    return archive
 
 
 def read_remote_json(host:Host, remote_path):
@@ -700,12 +1805,14 @@ def read_remote_json(host:Host, remote_path):
     :param remote_path: The full path to the remote JSON file.
     :return: A Python dictionary containing the JSON data.
     """
-    if remote_file_exists(host, remote_path):
-        # Open the remote file via SFTP
-        with host.conn.sftp().open(remote_path, 'r') as remote_file:
-            data = remote_file.read().decode('utf-8')  # Read and decode file content
-
-        # Parse JSON into Python dictionary
-        return json.loads(data)
-    else:
-        raise FileNotFoundError(f"Error reading remote file. \nFile {host.hostname}:{remote_path} does not exist")
+    try:
+        remote_file = host.sftp.open(remote_path, "rb")
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Error reading remote file. \n"
+                                f"File {host.hostname}:{remote_path} does not exist") from None
+
+    with remote_file:
+        # Request the whole file ahead instead of reading it block by block
+        remote_file.prefetch()
+        # json accepts the raw bytes, no need to decode them first
+        return json.loads(remote_file.read())
@@ -0,0 +1,120 @@
+import os
+import subprocess
+import threading
+
+import pytest
+
+from sheessh import sheessh
+
+
+class LocalChannel:
+    """
+    Stands in for a paramiko Channel with an executed command, the command runs in a local process.
+    """
+
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.combine_stderr = False
+        self.closed = False
+        self._proc = None
+
+    @property
+    def proc(self):
+        if self._proc is None:
+            self._proc = subprocess.Popen(self.cmd, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                          stderr=subprocess.STDOUT if self.combine_stderr else subprocess.PIPE)
+        return self._proc
+
+    def set_combine_stderr(self, combine):
+        self.combine_stderr = combine
+
+    def sendall(self, data):
+        self.proc.stdin.write(data)
+        self.proc.stdin.flush()
+
+    def recv(self, size):
+        return os.read(self.proc.stdout.fileno(), size)
+
+    def makefile(self, mode):
+        return self.proc.stdout
+
+    def makefile_stderr(self, mode):
+        return self.proc.stderr
+
+    def recv_exit_status(self):
+        return self.proc.wait()
+
+    def close(self):
+        self.closed = True
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.kill()
+            self._proc.wait()
+
+
+class LocalHost(sheessh.Host):
+    """
+    Host without a connection, its commands run on the local machine.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(hostname="local", **kwargs)
+
+    def open(self):
+        pass
+
+    def exec_channel(self, cmd):
+        return LocalChannel(cmd)
+
+
+@pytest.fixture
+def host():
+    host = LocalHost()
+    yield host
+    if host._shell_chan is not None:
+        host._shell_chan.close()
+
+
+def test_download_dir_stream_skips_unsafe_links(host, tmp_path):
+    src = tmp_path / "src"
+    (src / "sub").mkdir(parents=True)
+    (src / "sub" / "file.txt").write_text("content")
+    (src / "absolute").symlink_to("/etc/passwd")
+    (src / "outside").symlink_to("../../outside")
+    (src / "relative").symlink_to("sub/file.txt")
+
+    dest = tmp_path / "dest"
+    sheessh.download_dir_stream(host, str(src), dest)
+
+    assert (dest / "sub" / "file.txt").read_text() == "content"
+    assert not (dest / "absolute").is_symlink()
+    assert not (dest / "outside").is_symlink()
+    assert (dest / "relative").read_text() == "content"
+
+
+def test_run_fast_exit_code(host):
+    assert host.run_fast("exit 3", warn=True).exited == 3
+    assert host.run_fast("true").exited == 0
+    with pytest.raises(sheessh.UnexpectedExit):
+        host.run_fast("false")
+
+
+def test_run_fast_output(host):
+    assert host.run_fast("echo one; echo two").stdout == "one\ntwo\n"
+    assert host.run_fast("printf no-newline").stdout == "no-newline"
+    assert host.run_fast("true").stdout == ""
+
+
+def test_run_fast_merges_stderr(host):
+    assert host.run_fast("echo out; echo err >&2").stdout == "out\nerr\n"
+
+
+def test_run_fast_unbalanced_quote(host):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(host.run_fast("echo 'unterminated", warn=True)),
+                              daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive(), "run_fast is waiting for the rest of the command"
+    assert results[0].failed
+    # the persistent shell survived the syntax error
+    assert host.run_fast("echo ok").stdout == "ok\n"
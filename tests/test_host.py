@@ -0,0 +1,65 @@
+from sheessh import sheessh
+
+
+class FakeConnection:
+    """
+    Stands in for the pooled fabric Connection, counts how many times it was opened and closed.
+    """
+
+    def __init__(self):
+        self.is_connected = False
+        self._sftp = None
+        self.opened = 0
+        self.closed = 0
+
+    def open(self):
+        self.is_connected = True
+        self.opened += 1
+
+    def close(self):
+        self.is_connected = False
+        self.closed += 1
+
+
+def shared_hosts(count):
+    hosts = [sheessh.Host(hostname="pooled", user="test", keepalive=0) for _ in range(count)]
+    conn = FakeConnection()
+    for host in hosts:
+        host.conn = conn
+    return hosts, conn
+
+
+def test_hosts_share_pooled_connection():
+    first, second = sheessh.Host(hostname="shared"), sheessh.Host(hostname="shared")
+    assert first.conn is second.conn
+    assert sheessh.Host(hostname="other").conn is not first.conn
+
+
+def test_connection_closed_by_last_user():
+    (first, second), conn = shared_hosts(2)
+    with first:
+        with second:
+            assert conn.opened == 1
+        assert conn.is_connected
+    assert not conn.is_connected
+    assert conn.closed == 1
+
+
+def test_close_without_use_keeps_connection():
+    (first, second), conn = shared_hosts(2)
+    first.open()
+    second.close()
+    second.close()
+    assert conn.is_connected
+    first.close()
+    assert not conn.is_connected
+
+
+def test_host_reopens_after_close():
+    (host,), conn = shared_hosts(1)
+    host.open()
+    host.close()
+    host.open()
+    assert conn.is_connected
+    assert conn.opened == 2
+    host.close()
@@ -0,0 +1,185 @@
+import posixpath
+import stat
+from pathlib import PurePosixPath
+
+import pytest
+from invoke.runners import Result
+from paramiko.sftp_attr import SFTPAttributes
+
+from sheessh import sheessh
+
+
+class FakeSFTP:
+    """
+    In-memory remote file system, answers stat requests like paramiko SFTPClient.
+    """
+
+    def __init__(self):
+        self.dirs = {"/"}
+        self.files = set()
+        self.denied = set()
+        self.mtimes = {}
+        self.stats = 0
+
+    def stat(self, path):
+        self.stats += 1
+        path = posixpath.normpath(path)
+        if path in self.denied:
+            raise PermissionError(path)
+        attr = SFTPAttributes()
+        attr.st_size = 0
+        attr.st_mtime = self.mtimes.get(path, 0)
+        if path in self.dirs:
+            attr.st_mode = stat.S_IFDIR | 0o755
+        elif path in self.files:
+            attr.st_mode = stat.S_IFREG | 0o644
+        else:
+            raise FileNotFoundError(path)
+        return attr
+
+    def makedirs(self, path):
+        path = posixpath.normpath(path)
+        while path not in self.dirs:
+            self.dirs.add(path)
+            path = posixpath.dirname(path)
+
+
+class FakeHost(sheessh.Host):
+    """
+    Host without a connection, runs the mkdir -p && touch commands of the module on FakeSFTP.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(hostname="fake", **kwargs)
+        self.fake_sftp = FakeSFTP()
+
+    @property
+    def sftp(self):
+        return self.fake_sftp
+
+    def run_fast(self, cmd, hide=True, warn=False):
+        if cmd.startswith("mkdir -p -- "):
+            mkdir, _, touch = cmd.partition(" && touch -- ")
+            self.fake_sftp.makedirs(mkdir.removeprefix("mkdir -p -- ").strip("'"))
+            if touch:
+                self.fake_sftp.files.add(touch.strip("'"))
+        return Result(command=cmd, exited=0)
+
+
+@pytest.fixture
+def host():
+    return FakeHost()
+
+
+def test_positive_result_is_cached(host):
+    assert sheessh.remote_dir_exists(host, "/")
+    assert sheessh.remote_dir_exists(host, "/")
+    assert host.fake_sftp.stats == 1
+
+
+def test_missing_path_is_cached(host):
+    assert not sheessh.remote_path_exists(host, "/q")
+    assert not sheessh.remote_path_exists(host, "/q")
+    assert host.fake_sftp.stats == 1
+
+
+def test_mkdir_invalidates_missing_ancestors(host):
+    assert not sheessh.remote_path_exists(host, "/q")
+    assert not sheessh.remote_path_exists(host, "/q/r")
+    sheessh.remote_mkdir(host, "/q/r/s")
+    assert sheessh.remote_dir_exists(host, "/q")
+    assert sheessh.remote_dir_exists(host, "/q/r")
+    assert sheessh.remote_dir_exists(host, "/q/r/s")
+
+
+def test_touch_invalidates_missing_ancestors(host):
+    assert not sheessh.remote_dir_exists(host, "/n")
+    sheessh.touch_remote(host, "/n/m/f.txt")
+    assert sheessh.remote_dir_exists(host, "/n")
+    assert sheessh.remote_file_exists(host, "/n/m/f.txt")
+
+
+def test_invalidate_drops_descendants(host):
+    host.fake_sftp.makedirs("/d/e")
+    assert sheessh.remote_dir_exists(host, "/d/e")
+    host.fake_sftp.dirs -= {"/d", "/d/e"}
+    host._cache_invalidate("/d")
+    assert not sheessh.remote_path_exists(host, "/d/e")
+
+
+def test_cache_disabled(host):
+    host.stat_cache_ttl = 0
+    sheessh.remote_path_exists(host, "/")
+    sheessh.remote_path_exists(host, "/")
+    assert host.fake_sftp.stats == 2
+
+
+def test_cache_is_bounded(host, monkeypatch):
+    monkeypatch.setattr(sheessh, "_STAT_CACHE_SIZE", 3)
+    for name in "abcd":
+        sheessh.remote_path_exists(host, f"/{name}")
+    assert list(host._stat_cache) == ["/b", "/c", "/d"]
+
+
+def test_path_like(host):
+    path = PurePosixPath("/q/r")
+    assert not sheessh.remote_path_exists(host, path)
+    sheessh.remote_mkdir(host, path)
+    assert sheessh.remote_dir_exists(host, path)
+    assert sheessh.remote_is_dir(host, path)
+
+
+def test_cache_remote_paths_rejects_more_paths_than_cache_holds(host, monkeypatch):
+    monkeypatch.setattr(sheessh, "_STAT_CACHE_SIZE", 3)
+    with pytest.raises(ValueError):
+        sheessh.cache_remote_paths(host, ["/a", "/b", "/c", "/d"])
+
+
+def test_cache_remote_paths_with_cache_disabled(host, monkeypatch):
+    host.stat_cache_ttl = 0
+    monkeypatch.setattr(host, "run_fast", lambda *args, **kwargs: pytest.fail("command was run"))
+    sheessh.cache_remote_paths(host, ["/a"])
+
+
+def test_ssh_clears_cache(host, monkeypatch):
+    assert sheessh.remote_dir_exists(host, "/")
+    monkeypatch.setattr(host, "run", lambda cmd, **kwargs: Result(command=cmd, exited=0))
+    sheessh.ssh(host, "rm -rf /x")
+    assert not host._stat_cache
+
+
+def test_permission_denied_is_missing_and_not_cached(host):
+    host.fake_sftp.denied.add("/secret/f")
+    assert not sheessh.remote_path_exists(host, "/secret/f")
+    assert not sheessh.remote_file_exists(host, "/secret/f")
+    assert not sheessh.remote_dir_exists(host, "/secret/f")
+    with pytest.raises(FileNotFoundError):
+        sheessh.remote_is_dir(host, "/secret/f")
+    with pytest.raises(FileNotFoundError):
+        sheessh.remote_file_info(host, "/secret/f")
+    assert "/secret/f" not in host._stat_cache
+
+
+def test_dir_mtime_without_cache(host):
+    host.fake_sftp.makedirs("/logs")
+    assert sheessh.remote_dir_mtime(host, "/logs") == 0
+    host.fake_sftp.mtimes["/logs"] = 5
+    assert sheessh.remote_dir_mtime(host, "/logs") == 0
+    assert sheessh.remote_dir_mtime(host, "/logs", cache=False) == 5
+
+
+def test_cached_dir_size_validated_by_fresh_mtime(host, monkeypatch):
+    host.fake_sftp.makedirs("/logs")
+    monkeypatch.setattr(host, "run", lambda cmd, **kwargs: Result(command=cmd, stdout="200\t/logs\n", exited=0))
+    host._dir_size_cache["/logs"] = (0, 100)
+    assert sheessh.remote_dir_size(host, "/logs") == 100
+    host.fake_sftp.mtimes["/logs"] = 5
+    assert sheessh.remote_dir_size(host, "/logs") == 200
+
+
+def test_file_info_is_not_cached_by_default(host):
+    host.fake_sftp.files.add("/app.log")
+    assert sheessh.remote_file_info(host, "/app.log")["last_modified_epoch"] == 0
+    host.fake_sftp.mtimes["/app.log"] = 5
+    assert sheessh.remote_file_info(host, "/app.log")["last_modified_epoch"] == 5
+    assert sheessh.remote_path_info(host, "/app.log")["last_modified_epoch"] == 5